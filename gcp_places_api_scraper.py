@@ -1,156 +1,300 @@
-import requests
-import json
+import asyncio
 import math
-from typing import List, Dict, Set
-from dataclasses import dataclass
+import shelve
+import time
+import uuid
+from typing import List, Dict, Set, Tuple
 
-@dataclass
-class Coordinates:
-    latitude: float
-    longitude: float
+import aiohttp
+import numpy as np
+import orjson
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+from wilson_script import compute_wilson
 
 class RestaurantFinder:
     def __init__(self, api_key: str, center_lat: float, center_lng: float, radius_km: float):
         self.api_key = api_key
-        self.center = Coordinates(latitude=center_lat, longitude=center_lng)
+        self.center = (center_lat, center_lng)
         self.radius_km = radius_km
         self.seen_place_ids: Set[str] = set()
-        self.results: List[Dict] = []
+        # Results stream to a scratch JSONL file instead of accumulating in
+        # memory; only the dedup set stays resident during the scrape
+        self.scratch_path = "restaurants.jsonl"
+        self._out = None
         self.base_url = "https://places.googleapis.com/v1/places:searchNearby"
+        self.batch_url = "https://places.googleapis.com/batch"
+        self.batch_size = 50  # sub-requests per multipart batch POST
+        self.cache_path = "places_cache"  # shelve file for cached API responses
+        self.cache_ttl_seconds = 7 * 24 * 60 * 60  # responses are nearly static
+        # Places allows 600 requests per minute; smooth bursts to stay under quota
+        self._limiter = AsyncLimiter(600, 60)
         self.headers = {
             "Content-Type": "application/json",
             "X-Goog-Api-Key": self.api_key,
             "X-Goog-FieldMask": "places.displayName.text,places.primaryTypeDisplayName.text,places.rating,places.id,places.shortFormattedAddress,places.userRatingCount,places.location,places.googleMapsUri"
         }
 
-    def _calculate_new_coordinates(self, center: Coordinates, distance_km: float, bearing: float) -> Coordinates:
-        """Calculate new coordinates given a starting point, distance, and bearing."""
+    def _calculate_grid_points(self, search_radius_km: float) -> List[Tuple[float, float]]:
+        """Build a hexagonal lattice of (lat, lng) search points covering the
+        target radius."""
         R = 6371  # Earth's radius in kilometers
-        
-        lat1 = math.radians(center.latitude)
-        lon1 = math.radians(center.longitude)
-        bearing = math.radians(bearing)
-        
-        lat2 = math.asin(
-            math.sin(lat1) * math.cos(distance_km/R) +
-            math.cos(lat1) * math.sin(distance_km/R) * math.cos(bearing)
-        )
-        
-        lon2 = lon1 + math.atan2(
-            math.sin(bearing) * math.sin(distance_km/R) * math.cos(lat1),
-            math.cos(distance_km/R) - math.sin(lat1) * math.sin(lat2)
-        )
-        
-        return Coordinates(
-            latitude=math.degrees(lat2),
-            longitude=math.degrees(lon2)
+
+        # A hex lattice with sqrt(3)*r pitch covers the disk with the minimum
+        # number of circles, vs the over-sampled concentric rings it replaces
+        pitch_km = math.sqrt(3) * search_radius_km
+        # Axial indices of in-disk points reach 2R/(sqrt(3)*pitch), not R/pitch
+        max_index = math.ceil(2 * self.radius_km / (math.sqrt(3) * pitch_km))
+
+        # Axial hex coordinates mapped to planar km offsets from the center
+        axial = np.arange(-max_index, max_index + 1)
+        q, r = np.meshgrid(axial, axial)
+        q = q.ravel()
+        r = r.ravel()
+        x = pitch_km * (q + r / 2)
+        y = pitch_km * (math.sqrt(3) / 2) * r
+        distances = np.hypot(x, y)
+
+        inside = distances <= self.radius_km
+        x, y, distances = x[inside], y[inside], distances[inside]
+        bearings = np.arctan2(x, y)  # clockwise from north
+
+        center_lat, center_lng = self.center
+        lat1 = math.radians(center_lat)
+        lon1 = math.radians(center_lng)
+        sin_lat1 = math.sin(lat1)
+        cos_lat1 = math.cos(lat1)
+
+        # Destination-point formula over all lattice points at once
+        d_R = distances / R
+        sin_dR = np.sin(d_R)
+        cos_dR = np.cos(d_R)
+        lat2 = np.arcsin(sin_lat1 * cos_dR + cos_lat1 * sin_dR * np.cos(bearings))
+        lon2 = lon1 + np.arctan2(
+            np.sin(bearings) * sin_dR * cos_lat1,
+            cos_dR - sin_lat1 * np.sin(lat2)
         )
+        lats = np.degrees(lat2)
+        lngs = np.degrees(lon2)
 
-    def _get_restaurants_for_location(self, location: Coordinates, radius_meters: float) -> List[Dict]:
-        """Make API call to get restaurants for a specific location and radius."""
-        payload = {
+        return [(float(lat), float(lng)) for lat, lng in zip(lats, lngs)]
+
+    def _build_search_payload(self, location: Tuple[float, float], radius_meters: float) -> Dict:
+        """Build the searchNearby payload for a specific (lat, lng) and radius."""
+        latitude, longitude = location
+        return {
             "includedTypes": ["restaurant"],
             "maxResultCount": 20,
             "rankPreference": "DISTANCE",
             "locationRestriction": {
                 "circle": {
                     "center": {
-                        "latitude": location.latitude,
-                        "longitude": location.longitude
+                        "latitude": latitude,
+                        "longitude": longitude
                     },
                     "radius": radius_meters
                 }
             }
         }
-        
-        response = requests.post(self.base_url, headers=self.headers, json=payload)
-        return response.json().get("places", [])
+
+    def _build_batch_body(self, payloads: List[Dict], boundary: str) -> bytes:
+        """Assemble searchNearby payloads into one multipart/mixed batch body."""
+        parts = []
+        for i, payload in enumerate(payloads):
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <item{i}>\r\n"
+                "\r\n"
+                "POST /v1/places:searchNearby HTTP/1.1\r\n"
+                "Content-Type: application/json\r\n"
+                f"X-Goog-FieldMask: {self.headers['X-Goog-FieldMask']}\r\n"
+                "\r\n"
+                f"{orjson.dumps(payload).decode()}\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n")
+        return "".join(parts).encode("utf-8")
+
+    @staticmethod
+    def _parse_batch_response(body: bytes, content_type: str) -> List[Tuple[int, bytes]]:
+        """Split a multipart/mixed batch response into per-request
+        (inner HTTP status, JSON body) pairs."""
+        boundary = content_type.split("boundary=")[1].strip('"').encode("utf-8")
+        responses = []
+        for part in body.split(b"--" + boundary)[1:]:
+            if part.strip() in (b"", b"--"):
+                continue
+            # Each part is: part headers, inner HTTP status + headers, JSON body
+            _, inner_headers, json_body = part.split(b"\r\n\r\n", 2)
+            status_line = inner_headers.lstrip(b"\r\n").split(b"\r\n", 1)[0]
+            status = int(status_line.split()[1])
+            responses.append((status, json_body))
+        return responses
+
+    @retry(
+        retry=retry_if_exception_type(aiohttp.ClientResponseError),
+        wait=wait_exponential(multiplier=1, max=30),
+        stop=stop_after_attempt(5),
+    )
+    async def _post_batch(self, session: aiohttp.ClientSession, payloads: List[Dict]) -> List[List[Dict]]:
+        """POST one batch of search payloads, rate-limited and retried with backoff."""
+        boundary = f"batch_{uuid.uuid4().hex}"
+        headers = {
+            "Content-Type": f"multipart/mixed; boundary={boundary}",
+            "X-Goog-Api-Key": self.api_key,
+        }
+        body = self._build_batch_body(payloads, boundary)
+
+        # Every sub-query in the batch counts against the Places quota, so
+        # acquire capacity for the whole batch rather than one permit per POST
+        await self._limiter.acquire(len(payloads))
+        async with session.post(self.batch_url, headers=headers, data=body) as response:
+            response.raise_for_status()
+            sub_responses = self._parse_batch_response(
+                await response.read(),
+                response.headers["Content-Type"]
+            )
+
+        results = []
+        for status, json_body in sub_responses:
+            # The outer POST can be 200 while individual parts fail (e.g. a
+            # per-part 429); raise so the retry re-sends the batch instead of
+            # recording the error body as an empty grid point
+            if status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    (response,),
+                    status=status,
+                    message=f"batch sub-request failed with HTTP {status}"
+                )
+            results.append(orjson.loads(json_body).get("places", []))
+        return results
 
     def _process_results(self, places: List[Dict]) -> None:
         """Process and deduplicate restaurant results."""
         print(f"Processing {len(places)} places.")
+        # Localize hot names; this runs over every place in every response
+        seen = self.seen_place_ids
+        seen_add = seen.add
+        write = self._out.write
         for place in places:
             place_id = place.get("id")
-            if place_id and place_id not in self.seen_place_ids:
-                self.seen_place_ids.add(place_id)
-                
-                processed_result = {
-                    "name": place.get("displayName", {}).get("text"),
-                    "place_id": place_id,
-                    "type": place.get("primaryTypeDisplayName", {}).get("text"),
-                    "rating": place.get("rating"),
-                    "user_ratings_total": place.get("userRatingCount"),
-                    "location": place.get("location"),
-                    "address": place.get("shortFormattedAddress"),
-                    "maps_url": place.get("googleMapsUri")
-                }
-                
-                self.results.append(processed_result)
+            if not place_id or place_id in seen:
+                continue
+            seen_add(place_id)
 
-    def find_all_restaurants(self) -> List[Dict]:
-        """Find all restaurants within the specified radius."""
-        # Calculate smaller search radius to handle API limit
+            display_name = place.get("displayName")
+            primary_type = place.get("primaryTypeDisplayName")
+            write(orjson.dumps({
+                "name": display_name["text"] if display_name else None,
+                "place_id": place_id,
+                "type": primary_type["text"] if primary_type else None,
+                "rating": place.get("rating"),
+                "user_ratings_total": place.get("userRatingCount"),
+                "location": place.get("location"),
+                "address": place.get("shortFormattedAddress"),
+                "maps_url": place.get("googleMapsUri")
+            }) + b"\n")
+
+    @staticmethod
+    def _cache_key(location: Tuple[float, float], radius_meters: float) -> str:
+        """Cache key for one search: coordinates rounded to 6 decimals plus radius."""
+        return f"{location[0]:.6f},{location[1]:.6f},{radius_meters}"
+
+    async def _find_all_async(self) -> None:
+        """Query every grid point concurrently and collect the responses."""
         # Using 500m radius for each search to ensure overlap and complete coverage
         search_radius_km = 0.5
         search_radius_meters = search_radius_km * 1000
-        
-        # Calculate number of circles needed
-        num_circles = math.ceil(self.radius_km / (search_radius_km * 1.5))  # 1.5 for overlap
-        
-        # Create grid of search points
-        for ring in range(num_circles):
-            if ring == 0:
-                # Search center point
-                restaurants = self._get_restaurants_for_location(
-                    self.center,
-                    search_radius_meters
-                )
-                self._process_results(restaurants)
-            else:
-                # Calculate points around the ring
-                ring_radius_km = ring * (search_radius_km * 1.5)
-                num_points = max(8 * ring, 8)  # Increase points for outer rings
-                
-                for i in range(num_points):
-                    bearing = (360 / num_points) * i
-                    location = self._calculate_new_coordinates(
-                        self.center,
-                        ring_radius_km,
-                        bearing
-                    )
-                    
-                    restaurants = self._get_restaurants_for_location(
-                        location,
-                        search_radius_meters
-                    )
-                    self._process_results(restaurants)
-        
-        # Sort results by rating (highest first)
-        print(f"Found {len(self.results)} restaurants.")
-        self.results.sort(
-            key=lambda x: (
-                x.get("rating") if x.get("rating") is not None else 0,
-                x.get("user_ratings_total") if x.get("user_ratings_total") is not None else 0
-            ),
-            reverse=True
-        )
-        return self.results
+
+        grid_points = self._calculate_grid_points(search_radius_km)
+
+        now = time.time()
+        with shelve.open(self.cache_path) as cache:
+            # Serve repeat searches from the disk cache; only fetch what is missing
+            uncached_points = []
+            for point in grid_points:
+                entry = cache.get(self._cache_key(point, search_radius_meters))
+                if entry and now - entry["timestamp"] < self.cache_ttl_seconds:
+                    self._process_results(entry["places"])
+                else:
+                    uncached_points.append(point)
+
+            if not uncached_points:
+                return
+
+            payloads = [
+                self._build_search_payload(point, search_radius_meters)
+                for point in uncached_points
+            ]
+            batches = [
+                payloads[i:i + self.batch_size]
+                for i in range(0, len(payloads), self.batch_size)
+            ]
+
+            # One session spans the whole run; keep idle sockets warm so
+            # retried batches skip the TCP/TLS handshakes
+            connector = aiohttp.TCPConnector(limit=20, limit_per_host=10, keepalive_timeout=60)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                tasks = [self._post_batch(session, batch) for batch in batches]
+                batch_results = await asyncio.gather(*tasks)
+
+            # Batches preserve order, so the flattened results line up with
+            # their points
+            fetched = [
+                places for batch_places in batch_results
+                for places in batch_places
+            ]
+            for point, places in zip(uncached_points, fetched):
+                cache[self._cache_key(point, search_radius_meters)] = {
+                    "timestamp": now,
+                    "places": places
+                }
+                self._process_results(places)
+
+    def find_all_restaurants(self) -> List[Dict]:
+        """Find all restaurants within the specified radius."""
+        self._out = open(self.scratch_path, "wb")
+        try:
+            asyncio.run(self._find_all_async())
+        finally:
+            self._out.close()
+            self._out = None
+
+        # Stream the scratch file back for the one pass that does need every
+        # record at once: the final sort
+        with open(self.scratch_path, "rb") as f:
+            results = [orjson.loads(line) for line in f]
+
+        # Sort results by rating then review count (highest first) via lexsort
+        # over parallel arrays instead of a Python key lambda
+        print(f"Found {len(results)} restaurants.")
+        ratings = np.array([r.get("rating") or 0 for r in results], dtype=np.float64)
+        counts = np.array([r.get("user_ratings_total") or 0 for r in results], dtype=np.float64)
+        order = np.lexsort((counts, ratings))[::-1]
+        return [results[i] for i in order]
 
 def main():
     # Replace with your API key
     API_KEY = open('gcp_key.txt').read().strip()
-    
+
     # Colorado Springs coordinates
     CENTER_LAT = 38.878400
     CENTER_LNG = -104.767914
     RADIUS_KM = 15
-    
+
     finder = RestaurantFinder(API_KEY, CENTER_LAT, CENTER_LNG, RADIUS_KM)
     results = finder.find_all_restaurants()
-    
-    # Save results to JSON file
-    with open("restaurants.json", "w", encoding="utf-8") as f:
-        json.dump({"restaurants": results}, f, indent=2, ensure_ascii=False)
+
+    # Save results to JSON file; orjson writes UTF-8 bytes without escaping
+    with open("restaurants.json", "wb") as f:
+        f.write(orjson.dumps({"restaurants": results}, option=orjson.OPT_INDENT_2))
+
+    # Rank in-process as well, skipping the round-trip through restaurants.json
+    ranked = compute_wilson(results, confidence_level=0.95)
+    with open("restaurants_wilson_ranked.json", "wb") as f:
+        f.write(orjson.dumps({"restaurants": ranked}, option=orjson.OPT_INDENT_2))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
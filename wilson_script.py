@@ -1,60 +1,144 @@
-import json
+import functools
+import logging
 import math
 from typing import List, Dict
+
+import numpy as np
+import orjson
+from numba import njit, prange
 from scipy.stats import norm
 
-def wilson_score(positive_ratings: float, total_ratings: int, confidence_level: float = 0.95) -> float:
+logger = logging.getLogger(__name__)
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _wilson_kernel(positives: np.ndarray, totals: np.ndarray, z_score: float) -> np.ndarray:
     """
-    Calculate Wilson Score Interval for a given rating and number of ratings.
-    
+    Fused Wilson lower-bound kernel: one compiled pass over the arrays with
+    no intermediate allocations, parallelized across restaurants.
+    """
+    out = np.empty_like(totals)
+    z_squared = z_score * z_score
+    for i in prange(totals.shape[0]):
+        n = totals[i]
+        if n == 0:
+            out[i] = 0.0
+            continue
+        p = positives[i] / n
+        out[i] = ((p + z_squared / (2 * n) -
+                   z_score * math.sqrt((p * (1 - p) + z_squared / (4 * n)) / n)) /
+                  (1 + z_squared / n))
+    return out
+
+@functools.lru_cache(maxsize=8)
+def _z_for(confidence_level: float) -> float:
+    """
+    Return the z-score for a given confidence level, cached so scipy's
+    norm.ppf runs once per level instead of once per restaurant.
+    """
+    if not 0 < confidence_level < 1:
+        raise ValueError("Confidence level must be between 0 and 1")
+    return norm.ppf(1 - (1 - confidence_level) / 2)
+
+def wilson_score_z(positive_ratings: float, total_ratings: int, z_score: float) -> float:
+    """
+    Calculate the Wilson Score lower bound given a precomputed z-score.
+
     Args:
         positive_ratings (float): The number of positive ratings (converted from overall rating)
         total_ratings (int): Total number of ratings received
-        confidence_level (float): Statistical confidence level between 0 and 1:
-            - 0.90 for more aggressive rankings (favors newer places)
-            - 0.95 for balanced rankings (default)
-            - 0.99 for conservative rankings (favors established places)
-    
+        z_score (float): Z-score for the desired confidence level (see _z_for)
+
     Returns:
         float: Lower bound of Wilson Score Interval
     """
     if total_ratings == 0:
         return 0
 
-    if not 0 < confidence_level < 1:
-        raise ValueError("Confidence level must be between 0 and 1")
-    
-    # Z-score for the given confidence level
-    z_score = norm.ppf(1 - (1 - confidence_level) / 2)
-    print(f"Debug: z_score = {z_score}")
-    
     # Observed proportion of positive ratings
     observed_proportion = positive_ratings / total_ratings
-    print(f"Debug: observed_proportion = {observed_proportion}")
-    
+
     # Wilson score calculation components
     z_squared = z_score * z_score
-    print(f"Debug: z_squared = {z_squared}")
-    
-    numerator = (observed_proportion + 
-                 (z_squared / (2 * total_ratings)) - 
-                 (z_score * math.sqrt((observed_proportion * (1 - observed_proportion) + 
+
+    numerator = (observed_proportion +
+                 (z_squared / (2 * total_ratings)) -
+                 (z_score * math.sqrt((observed_proportion * (1 - observed_proportion) +
                                      z_squared / (4 * total_ratings)) / total_ratings)))
-    print(f"Debug: numerator = {numerator}")
-    
+
     denominator = 1 + z_squared / total_ratings
-    print(f"Debug: denominator = {denominator}")
-    
-    result = numerator / denominator
-    print(f"Debug: result = {result}")
+
+    return numerator / denominator
+
+def wilson_score(positive_ratings: float, total_ratings: int, confidence_level: float = 0.95) -> float:
+    """
+    Calculate Wilson Score Interval for a given rating and number of ratings.
+
+    Args:
+        positive_ratings (float): The number of positive ratings (converted from overall rating)
+        total_ratings (int): Total number of ratings received
+        confidence_level (float): Statistical confidence level between 0 and 1:
+            - 0.90 for more aggressive rankings (favors newer places)
+            - 0.95 for balanced rankings (default)
+            - 0.99 for conservative rankings (favors established places)
+
+    Returns:
+        float: Lower bound of Wilson Score Interval
+    """
+    return wilson_score_z(positive_ratings, total_ratings, _z_for(confidence_level))
+
+def compute_wilson(restaurant_list: List[Dict], confidence_level: float = 0.95) -> List[Dict]:
+    """
+    Score an in-memory restaurant list with the Wilson lower bound and return
+    it sorted best-first, so callers can rank without a file round-trip.
+
+    Args:
+        restaurant_list (List[Dict]): Restaurant dicts with 'rating' and
+            'user_ratings_total' keys, as produced by the scraper
+        confidence_level (float): Confidence level for Wilson Score calculation:
+            - 0.90 favors newer places with fewer ratings
+            - 0.95 provides balanced rankings (default)
+            - 0.99 favors established places with many ratings
+
+    Returns:
+        List[Dict]: The same dicts, annotated and sorted by Wilson score
+    """
+    # Z-score is constant for the whole run; compute it once
+    z_score = _z_for(confidence_level)
+    # Lazy %s formatting: no string is built unless DEBUG logging is enabled
+    logger.debug("z_score = %s for confidence level %s", z_score, confidence_level)
+
+    # Calculate Wilson scores for all restaurants in one compiled pass
+    ratings = np.array([r.get('rating') or 0 for r in restaurant_list], dtype=np.float64)
+    counts = np.array([r.get('user_ratings_total') or 0 for r in restaurant_list], dtype=np.float64)
+
+    # Convert 5-star ratings to proportions of positive ratings
+    positive_ratios = np.clip((ratings - 3) / 2, 0, None)
+    positive_counts = positive_ratios * counts
+
+    wilson_scores = _wilson_kernel(positive_counts, counts, z_score)
+
+    # Assign scores and calculation metadata back onto the dicts
+    for restaurant, score, ratio, positives in zip(
+            restaurant_list, wilson_scores, positive_ratios, positive_counts):
+        restaurant['wilson_score'] = float(score)
+        restaurant['ranking_metadata'] = {
+            'confidence_level': confidence_level,
+            'positive_ratio': float(ratio),
+            'positive_ratings': float(positives)
+        }
     
-    return result
+    # Sort restaurants by Wilson score in descending order; argsort runs in C
+    # over the already-computed score array instead of calling a key lambda
+    order = np.argsort(-wilson_scores, kind='stable')
+    sorted_restaurants = [restaurant_list[i] for i in order]
+    logger.debug("Ranked %d restaurants", len(sorted_restaurants))
+    return sorted_restaurants
 
 def rank_restaurants(input_file: str, output_file: str, confidence_level: float = 0.95):
     """
     Read restaurants from input JSON file, rank them using Wilson Score,
     and write sorted results to output JSON file.
-    
+
     Args:
         input_file (str): Path to input JSON file
         output_file (str): Path to output JSON file
@@ -64,43 +148,11 @@ def rank_restaurants(input_file: str, output_file: str, confidence_level: float
             - 0.99 favors established places with many ratings
     """
     # Read input JSON file
-    with open(input_file, 'r') as file:
-        data = json.load(file)
-    
+    with open(input_file, 'rb') as file:
+        data = orjson.loads(file.read())
+
     restaurant_list = data.get('restaurants', [])
-    
-    # Calculate Wilson score for each restaurant
-    for restaurant in restaurant_list:
-        star_rating = restaurant.get('rating', 0)
-        rating_count = restaurant.get('user_ratings_total', 0)
-        
-        # Convert 5-star rating to proportion of positive ratings
-        print("star_rating: " + str(star_rating))
-        positive_ratio = max(0, (star_rating - 3) / 2)
-        positive_rating_count = positive_ratio * rating_count
-        
-        # Calculate Wilson score with specified confidence level
-        print("Restaurant: " + restaurant.get('name'))
-        wilson_lower_bound = wilson_score(
-            positive_ratings=positive_rating_count,
-            total_ratings=rating_count,
-            confidence_level=confidence_level
-        )
-        restaurant['wilson_score'] = wilson_lower_bound
-        
-        # Add additional metadata about the calculation
-        restaurant['ranking_metadata'] = {
-            'confidence_level': confidence_level,
-            'positive_ratio': positive_ratio,
-            'positive_ratings': positive_rating_count
-        }
-    
-    # Sort restaurants by Wilson score in descending order
-    sorted_restaurants = sorted(
-        restaurant_list,
-        key=lambda restaurant: restaurant.get('wilson_score', 0),
-        reverse=True
-    )
+    sorted_restaurants = compute_wilson(restaurant_list, confidence_level)
     
     # Prepare output data with metadata
     output_data = {
@@ -114,8 +166,8 @@ def rank_restaurants(input_file: str, output_file: str, confidence_level: float
     }
     
     # Write sorted results to output file
-    with open(output_file, 'w') as file:
-        json.dump(output_data, file, indent=2)
+    with open(output_file, 'wb') as file:
+        file.write(orjson.dumps(output_data, option=orjson.OPT_INDENT_2))
 
 def get_ranking_interpretation(confidence_level: float) -> str:
     """
@@ -133,15 +185,18 @@ def get_ranking_interpretation(confidence_level: float) -> str:
 if __name__ == "__main__":
     import sys
     import argparse
-    import json  # Ensure json is imported
 
     parser = argparse.ArgumentParser(description='Rank restaurants using Wilson Score Interval')
     parser.add_argument('input_file', help='Input JSON file path')
     parser.add_argument('output_file', help='Output JSON file path')
     parser.add_argument('--confidence', type=float, default=0.95,
                         help='Confidence level (0.90, 0.95, or 0.99)')
-    
+    parser.add_argument('--verbose', action='store_true',
+                        help='Enable debug logging')
+
     args = parser.parse_args()  # Correctly parse the arguments
 
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
     # Call the rank_restaurants function with parsed arguments
     rank_restaurants(args.input_file, args.output_file, args.confidence)
\ No newline at end of file